@@ -1,7 +1,16 @@
 import os
-import uuid
+import asyncio
+import atexit
 import logging
 import json
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import numpy as np
+import torch
 from chromadb import PersistentClient
 from sentence_transformers import SentenceTransformer
 import openai
@@ -9,6 +18,7 @@ from dotenv import load_dotenv
 
 # Import utilities
 from utils.file_utils import extract_text, split_text_into_sections
+from analysis.embedding_cache import EmbeddingCache
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -22,8 +32,150 @@ if not openai_api_key:
     logger.warning("OPENAI_API_KEY environment variable not found. OpenAI API calls will fail.")
 else:
     logger.info("OPENAI_API_KEY found.")
-    
-openai.api_key = openai_api_key
+
+# Chat model and overall time budget (including retries) for the essentials analysis
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+# Each attempt gets a share of the overall budget so the client's retries can run
+# before asyncio.wait_for cancels the request
+OPENAI_MAX_RETRIES = 2
+OPENAI_ATTEMPT_TIMEOUT = OPENAI_TIMEOUT / (OPENAI_MAX_RETRIES + 1)
+
+# Bound PyTorch's thread pools so multiple server workers do not oversubscribe the CPU.
+# Gradients are disabled per call with inference_mode(), since grad mode is thread-local
+# and the analyses run in worker threads
+torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS", "4")))
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError as e:
+    logger.warning(f"Could not set PyTorch inter-op threads: {e}")
+
+# Sentence embedding model used for all collections and queries
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# Serve the model through ONNX Runtime with int8 weights instead of PyTorch
+USE_ONNX = os.getenv("USE_ONNX") == "1"
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), 'onnx_model'))
+# Quantize the PyTorch model's linear layers to int8 for CPU inference
+TORCH_INT8 = os.getenv("TORCH_INT8") == "1"
+
+# Sample files the collections are built from
+INVALID_CLAUSE_FILES = ["Mietvertrag_potentially_invalid.docx"]
+SAMPLE_AGREEMENT_FILES = ["Mietvertrag_2.docx", "Mietvertrag_3.docx", "Mietvertrag_4.docx",
+                          "Mietvertrag_5.docx", "Mietvertrag_6.docx", "Mietvertrag_7.docx", "Mietrecht_GESETZ.docx"]
+
+# Instructions for the essentials analysis; kept identical between calls so the
+# API can reuse the cached prompt prefix
+ESSENTIALS_SYSTEM_PROMPT = """Du bist ein hilfreicher Assistent, der Mietverträge analysiert.
+Bitte überprüfe den Mietvertrag in der Nachricht des Nutzers auf seine wesentlichen Vertragsinhalte. Die wesentlichen Vertragsinhalte eines Mietvertrags sind:
+1. Die Vertragsparteien
+2. Der Mietgegenstand
+3. Die Miete
+4. Der Mietbeginn
+
+Falls einer dieser Punkte nicht genannt ist, gib den Wert als `null` zurück."""
+# The essentials are stated at the start of a contract; longer texts are truncated
+ESSENTIALS_MAX_CHARS = int(os.getenv("ESSENTIALS_MAX_CHARS", "16000"))
+
+# Structured output schema for the essential contents of a rental agreement
+ESSENTIALS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "mietvertrag",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "vertragsparteien": {"type": ["string", "null"]},
+                "mietgegenstand": {"type": ["string", "null"]},
+                "miete": {"type": ["string", "null"]},
+                "mietbeginn": {"type": ["string", "null"]}
+            },
+            "required": ["vertragsparteien", "mietgegenstand", "miete", "mietbeginn"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Squared L2 distance thresholds used to classify sentences
+SAMPLE_DISTANCE_THRESHOLD = 4
+INVALID_DISTANCE_THRESHOLD = 4
+
+# Batch size for bulk encoding of the sample corpus; encode() sorts by length
+# internally, so a large batch still pads only per mini-batch
+SBERT_BATCH = 1024
+
+# Chroma's default maximum number of rows per add() call
+CHROMA_MAX_BATCH = 5461
+
+# Number of CPU worker processes for encoding large batches (1 disables the pool)
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", "1"))
+# Batches with more texts than this are encoded by the worker pool
+MULTI_PROCESS_THRESHOLD = 256
+
+# Keep the in-memory search matrices in float32 instead of float16
+EMBEDDING_FLOAT32 = os.getenv("EMBEDDING_FLOAT32") == "1"
+
+# Sentences shorter than this are not analyzed
+MIN_SENTENCE_LENGTH = 40
+# Return empty placeholder entries for the short sentences to keep the document order intact
+INCLUDE_SHORT_SENTENCES = os.getenv("INCLUDE_SHORT_SENTENCES", "1") == "1"
+
+# Fallback clauses used when no clauses could be extracted from the sample files
+DEFAULT_CLAUSES = {
+    "invalid_clauses": [
+        "Der Mietvertrag muss die genaue Anschrift der Wohnung enthalten.",
+        "Die Namen und Anschriften aller Mietparteien müssen angegeben sein.",
+        "Die monatliche Miethöhe muss klar festgelegt sein."
+    ],
+    "sample_agreements": [
+        "§1 Mieträume: Der Vermieter vermietet an den Mieter zu Wohnzwecken die Wohnung.",
+        "§2 Mietdauer: Das Mietverhältnis beginnt am 01.01.2023."
+    ]
+}
+
+# Bump when text extraction or splitting changes so existing collections are rebuilt
+COLLECTION_FORMAT_VERSION = 2
+
+# In-process LRU of recent embeddings keyed by (id(model), text), shared by
+# all instances so it survives instance churn but not model swaps
+_EMBEDDING_LRU_SIZE = 4096
+_embedding_lru = OrderedDict()
+_embedding_lru_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def _load_model(model_name, use_onnx, torch_int8=False):
+    """
+    Load the sentence embedding model once per process.
+
+    Args:
+        model_name (str): Hugging Face model name
+        use_onnx (bool): Serve the int8 ONNX export instead of PyTorch
+        torch_int8 (bool): Dynamically quantize the linear layers to int8 on CPU
+
+    Returns:
+        tuple: The model and an id identifying model and backend
+    """
+    if use_onnx:
+        from analysis.onnx_encoder import OnnxSentenceEncoder
+        return OnnxSentenceEncoder(ONNX_MODEL_DIR), f"{model_name}:onnx-int8"
+
+    model = SentenceTransformer(model_name)
+    model.eval()
+
+    # Half precision on GPU halves weight and activation bandwidth
+    if torch.cuda.is_available():
+        model = model.to("cuda").half()
+        return model, f"{model_name}:cuda-fp16"
+
+    # int8 weights halve the memory traffic of the linear layers and use VNNI where available
+    if torch_int8:
+        transformer = model[0]
+        transformer.auto_model = torch.ao.quantization.quantize_dynamic(
+            transformer.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        return model, f"{model_name}:torch-int8"
+    return model, model_name
 
 class RentalAnalysis:
     """
@@ -44,43 +196,204 @@ class RentalAnalysis:
         # Initialize ChromaDB client
         self.client = PersistentClient(path=data_dir)
 
-        # Initialize sentence embedding model
-        self.model = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-        
-        # Create collections
-        self.invalid_clauses = self.client.get_or_create_collection("invalid_clauses")
-        self.sample_agreements = self.client.get_or_create_collection("sample_agreements")
-        
-        # Populate collections if they're empty
+        # Async OpenAI client so waiting on the API does not block a worker
+        self.openai_client = openai.AsyncOpenAI(
+            api_key=openai_api_key, timeout=OPENAI_ATTEMPT_TIMEOUT, max_retries=OPENAI_MAX_RETRIES
+        ) if openai_api_key else None
+
+        # Initialize sentence embedding model (shared between instances)
+        self.model, self.model_id = _load_model(MODEL_NAME, USE_ONNX, TORCH_INT8)
+        # Resolve the device once instead of letting every encode() call look it up
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        # Start a pool of encoding processes for large CPU workloads
+        self._pool = None
+        if ENCODE_WORKERS > 1 and not USE_ONNX and not torch.cuda.is_available():
+            self._pool = self.model.start_multi_process_pool(['cpu'] * ENCODE_WORKERS)
+            atexit.register(self.model.stop_multi_process_pool, self._pool)
+            logger.info(f"Started {ENCODE_WORKERS} encoding worker processes")
+
+        # Persistent cache so unchanged clauses are not re-embedded
+        self.embedding_cache = EmbeddingCache(os.path.join(data_dir, 'embedding_cache.sqlite3'), self.model_id)
+
+        # Content hashes of the sample files, reused while size and mtime are unchanged
+        self._file_signatures_path = os.path.join(data_dir, '.cache_sig')
+        self._file_signatures = self._load_file_signatures()
+
+        # Create and populate collections if their sample data changed
         self._initialize_collections()
+
+        # Keep both small collections in memory for exact search
+        self._sample_matrix, self._sample_norms, self._sample_docs = self._load_search_index(self.sample_agreements)
+        self._invalid_matrix, self._invalid_norms, self._invalid_docs = self._load_search_index(self.invalid_clauses)
         
         logger.info("Rental agreement analysis initialized")
     
     def _initialize_collections(self):
-        """Initialize collections with data on each startup."""
-        # Check if collections exist and delete them if they do
+        """Initialize collections, rebuilding them only when their sample data has changed."""
+        self.invalid_clauses = self._initialize_collection("invalid_clauses", INVALID_CLAUSE_FILES)
+        self.sample_agreements = self._initialize_collection("sample_agreements", SAMPLE_AGREEMENT_FILES)
+
+    def _initialize_collection(self, collection_name, sample_files):
+        """
+        Get a collection, repopulating it if it is empty or was built from
+        different sample files or a different embedding model.
+
+        Args:
+            collection_name: Name of the collection
+            sample_files: List of sample files the collection is built from
+
+        Returns:
+            The ChromaDB collection
+        """
+        version = self._sample_files_version(sample_files)
+        collection = self.client.get_or_create_collection(collection_name)
+        if collection.count() > 0 and (collection.metadata or {}).get("version") == version:
+            logger.info(f"{collection_name} collection is up to date")
+            return collection
+
+        # Delete and recreate the outdated collection
         try:
-            if "invalid_clauses" in [col.name for col in self.client.list_collections()]:
-                self.client.delete_collection("invalid_clauses")
-            if "sample_agreements" in [col.name for col in self.client.list_collections()]:
-                self.client.delete_collection("sample_agreements")
-            
-            # Recreate collections
-            self.invalid_clauses = self.client.create_collection("invalid_clauses")
-            self.sample_agreements = self.client.create_collection("sample_agreements")
+            self.client.delete_collection(collection_name)
+            collection = self.client.create_collection(collection_name)
         except Exception as e:
-            logger.error(f"Error reinitializing collections: {e}")
-            # If there was an error deleting, try to get existing collections
-            self.invalid_clauses = self.client.get_or_create_collection("invalid_clauses")
-            self.sample_agreements = self.client.get_or_create_collection("sample_agreements")
+            logger.error(f"Error reinitializing collection {collection_name}: {e}")
+            # If there was an error deleting, try to get the existing collection
+            collection = self.client.get_or_create_collection(collection_name)
+
+        logger.info(f"Populating {collection_name} collection")
+        self._populate_collection(collection, collection_name, sample_files)
+
+        # Only mark the collection as current once it is fully populated
+        collection.modify(metadata={"version": version})
+        return collection
+
+    def _sample_files_version(self, sample_files):
+        """Compute a hash over the embedding model, the collection format and the sample files."""
+        digest = hashlib.sha256(f"{self.model_id}\0{COLLECTION_FORMAT_VERSION}".encode("utf-8"))
+        for filename in sample_files:
+            digest.update(b"\0" + filename.encode("utf-8") + b"\0")
+            file_path = os.path.join(self.sample_data_dir, filename)
+            if os.path.exists(file_path):
+                digest.update(self._file_digest(file_path).encode("ascii"))
+        return digest.hexdigest()
+
+    def _file_digest(self, file_path):
+        """
+        Return the SHA-256 of a file, reading it only if its size or
+        modification time changed since the digest was last recorded.
+        """
+        stat = os.stat(file_path)
+        signature = self._file_signatures.get(file_path)
+        if signature and signature["size"] == stat.st_size and signature["mtime"] == stat.st_mtime_ns:
+            return signature["sha256"]
+
+        with open(file_path, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        self._file_signatures[file_path] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": sha256}
+        self._save_file_signatures()
+        return sha256
+
+    def _load_file_signatures(self):
+        """Load the recorded sample file signatures."""
+        try:
+            with open(self._file_signatures_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"Error reading file signatures: {e}")
+            return {}
+
+    def _save_file_signatures(self):
+        """Persist the sample file signatures."""
+        try:
+            with open(self._file_signatures_path, 'w', encoding='utf-8') as f:
+                json.dump(self._file_signatures, f)
+        except Exception as e:
+            logger.error(f"Error writing file signatures: {e}")
+
+    def _load_search_index(self, collection):
+        """
+        Load all embeddings and documents of a collection for exact in-memory search.
+
+        Args:
+            collection: The ChromaDB collection to load
+
+        Returns:
+            tuple: Embedding matrix, squared row norms and the list of documents
+        """
+        data = collection.get(include=["embeddings", "documents"])
+        matrix = np.asarray(data["embeddings"], dtype=np.float32)
+        squared_norms = (matrix * matrix).sum(axis=1)
+        # Embeddings are already rounded to float16 by _encode(), so storing
+        # them as float16 halves the memory without losing precision
+        if not EMBEDDING_FLOAT32:
+            matrix = matrix.astype(np.float16)
+        return matrix, squared_norms, list(data["documents"])
+
+    @staticmethod
+    def _nearest(queries, matrix, squared_norms):
+        """
+        Find the nearest row of matrix for each query with a single matrix product.
+        Distances are squared L2 distances, the same metric as Chroma's default.
+
+        Args:
+            queries (numpy.ndarray): Query embeddings of shape (N, D)
+            matrix (numpy.ndarray): Collection embeddings of shape (M, D)
+            squared_norms (numpy.ndarray): Squared L2 norms of the rows of matrix
+
+        Returns:
+            tuple: Index of the nearest row and its distance for each query
+        """
+        # Accumulate in float32 even when the matrix is stored as float16
+        queries = queries.astype(np.float32, copy=False)
+        products = queries @ matrix.astype(np.float32, copy=False).T
+        distances = (queries * queries).sum(axis=1)[:, None] - 2.0 * products + squared_norms[None, :]
+        best = distances.argmin(axis=1)
+        return best, np.maximum(distances[np.arange(len(queries)), best], 0.0)
+
+    @staticmethod
+    def _classify(sample_distances, invalid_distances):
+        """
+        Classify all sentences at once from their nearest-neighbour distances.
+
+        Args:
+            sample_distances (numpy.ndarray): Distances to the closest sample clause
+            invalid_distances (numpy.ndarray): Distances to the closest invalid clause
+
+        Returns:
+            tuple: Boolean masks marking unusual and invalid sentences
+        """
+        return sample_distances > SAMPLE_DISTANCE_THRESHOLD, invalid_distances <= INVALID_DISTANCE_THRESHOLD
+
+    def _extract_sample_clauses(self, filename):
+        """
+        Extract the clauses of a single sample file.
+
+        Args:
+            filename: Name of the file in the sample data folder
+
+        Returns:
+            list: Extracted clauses, empty if the file is missing or unreadable
+        """
+        file_path = os.path.join(self.sample_data_dir, filename)
         
-        # Populate collections
-        logger.info("Populating invalid clauses collection")
-        self._populate_invalid_clauses()
+        # Check if file exists
+        if not os.path.exists(file_path):
+            logger.warning(f"Sample file not found: {file_path}")
+            return []
         
-        logger.info("Populating sample agreement collection")
-        self._populate_sample_agreements()
-    
+        # Extract text from the file
+        try:
+            text = extract_text(file_path)
+            sample_clauses = split_text_into_sections(text)
+            logger.info(f"Extracted {len(sample_clauses)} clauses from {filename}")
+            return sample_clauses
+        except Exception as e:
+            logger.error(f"Error extracting text from {filename}: {e}")
+            return []
+
     def _populate_collection(self, collection, collection_name, sample_files):
         """
         Generic method to populate a collection with clauses from sample files.
@@ -90,71 +403,118 @@ class RentalAnalysis:
             collection_name: Name of the collection (for logging purposes)
             sample_files: List of sample files to process
         """
-        all_sample_clauses = []
-        
-        # Process each sample file
-        for filename in sample_files:
-            file_path = os.path.join(self.sample_data_dir, filename)
-            
-            # Check if file exists
-            if not os.path.exists(file_path):
-                logger.warning(f"Sample file not found: {file_path}")
-                continue
-            
-            # Extract text from the file
-            try:
-                text = extract_text(file_path)
-                sample_clauses = split_text_into_sections(text)
-                
-                logger.info(f"Extracted {len(sample_clauses)} clauses from {filename}")
-                
-                # Add to the combined list
-                all_sample_clauses.extend(sample_clauses)
-            except Exception as e:
-                logger.error(f"Error extracting text from {filename}: {e}")
+        # Extract the sample files concurrently; parsing is independent per file
+        with ThreadPoolExecutor(max_workers=min(8, max(1, len(sample_files)))) as executor:
+            per_file_clauses = list(executor.map(self._extract_sample_clauses, sample_files))
+        all_sample_clauses = list(chain.from_iterable(per_file_clauses))
         
         # If no clauses were found in any file, use default set
         if not all_sample_clauses:
             logger.warning(f"No clauses found in any sample files for {collection_name}. Using default set.")
-            if collection_name == "invalid_clauses":
-                all_sample_clauses = [
-                    "Der Mietvertrag muss die genaue Anschrift der Wohnung enthalten.",
-                    "Die Namen und Anschriften aller Mietparteien müssen angegeben sein.",
-                    "Die monatliche Miethöhe muss klar festgelegt sein."
-                ]
-            else:  # sample_agreements
-                all_sample_clauses = [
-                    "§1 Mieträume: Der Vermieter vermietet an den Mieter zu Wohnzwecken die Wohnung.",
-                    "§2 Mietdauer: Das Mietverhältnis beginnt am 01.01.2023."
-                ]
+            all_sample_clauses = list(DEFAULT_CLAUSES[collection_name])
         
         # Create embeddings for all clauses
-        embeddings = self.model.encode(all_sample_clauses)
-        
-        # Add each clause to the collection
-        for clause, emb in zip(all_sample_clauses, embeddings):
-            # Extract clause number if available (for sample agreements)
-            metadata = {"info": "Beispiel"}
+        embeddings = self._encode(all_sample_clauses, batch_size=SBERT_BATCH)
+
+        # Add the clauses in as few calls as Chroma's batch limit allows
+        documents = list(all_sample_clauses)
+        embeddings = embeddings.tolist()
+        ids = [f"{collection_name}-{i}" for i in range(len(documents))]
+        metadatas = [{"info": "Beispiel"} for _ in documents]
+        for start in range(0, len(documents), CHROMA_MAX_BATCH):
+            end = start + CHROMA_MAX_BATCH
             collection.add(
-                documents=[clause],
-                embeddings=[emb.tolist()],
-                ids=[str(uuid.uuid4())],
-                metadatas=[metadata]
+                documents=documents[start:end],
+                embeddings=embeddings[start:end],
+                ids=ids[start:end],
+                metadatas=metadatas[start:end]
             )
-        
+
         logger.info(f"Added {len(all_sample_clauses)} clauses to {collection_name} collection")
     
-    def _populate_invalid_clauses(self):
-        """Populate the invalid clauses collection with essential clauses for rental agreements."""
-        sample_files = ["Mietvertrag_potentially_invalid.docx"]
-        self._populate_collection(self.invalid_clauses, "invalid_clauses", sample_files)
-    
-    def _populate_sample_agreements(self):
-        """Populate the sample agreement collection with clauses from sample rental agreement files."""
-        sample_files = ["Mietvertrag_2.docx", "Mietvertrag_3.docx", "Mietvertrag_4.docx", 
-                      "Mietvertrag_5.docx", "Mietvertrag_6.docx", "Mietvertrag_7.docx", "Mietrecht_GESETZ.docx"]
-        self._populate_collection(self.sample_agreements, "sample_agreements", sample_files)
-    
+    def _encode(self, texts, batch_size=64):
+        """
+        Embed a list of texts, reusing embeddings from the in-process LRU
+        and the persistent cache.
+
+        Args:
+            texts (list): Texts to embed
+            batch_size (int): Batch size passed to the embedding model
+
+        Returns:
+            numpy.ndarray: Embeddings in the same order as texts
+        """
+        model_id = id(self.model)
+        embeddings = {}
+        with _embedding_lru_lock:
+            for text in texts:
+                embedding = _embedding_lru.get((model_id, text))
+                if embedding is not None:
+                    _embedding_lru.move_to_end((model_id, text))
+                    embeddings[text] = embedding
+
+        # Fall back to the persistent cache, then to the model
+        uncached = list(dict.fromkeys(text for text in texts if text not in embeddings))
+        fetched = self.embedding_cache.get_many(uncached) if uncached else {}
+        missing = [text for text in uncached if text not in fetched]
+        if missing:
+            # encode() sorts the batch by length internally and restores the
+            # original order, so padding stays minimal per mini-batch.
+            # Round to float16 like the cached vectors so results do not
+            # depend on whether an embedding came from the cache
+            if self._pool is not None and len(missing) > MULTI_PROCESS_THRESHOLD:
+                # Small batches stay in-process to avoid the IPC overhead
+                new_embeddings = self.model.encode_multi_process(
+                    missing, self._pool, batch_size=batch_size
+                ).astype(np.float16)
+            else:
+                new_embeddings = self._encode_batch(missing, batch_size).astype(np.float16)
+            self.embedding_cache.set_many(missing, new_embeddings)
+            fetched.update(zip(missing, new_embeddings.astype(np.float32)))
+
+        if fetched:
+            embeddings.update(fetched)
+            with _embedding_lru_lock:
+                for text, embedding in fetched.items():
+                    _embedding_lru[(model_id, text)] = embedding
+                while len(_embedding_lru) > _EMBEDDING_LRU_SIZE:
+                    _embedding_lru.popitem(last=False)
+
+        if not texts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.stack([embeddings[text] for text in texts])
+
+    def _encode_batch(self, texts, batch_size):
+        """
+        Run the embedding model on texts, halving the batch size whenever
+        encoding runs out of memory.
+
+        Args:
+            texts (list): Texts to embed
+            batch_size (int): Initial batch size
+
+        Returns:
+            numpy.ndarray: Embeddings in the same order as texts
+        """
+        while True:
+            try:
+                with torch.inference_mode():
+                    return self.model.encode(
+                        texts,
+                        batch_size=batch_size,
+                        convert_to_numpy=True,
+                        show_progress_bar=False,
+                        device=self.device
+                    )
+            except (RuntimeError, MemoryError) as e:
+                out_of_memory = isinstance(e, MemoryError) or "out of memory" in str(e).lower()
+                if not out_of_memory or batch_size <= 1:
+                    raise
+                batch_size //= 2
+                logger.warning(f"Out of memory while encoding, retrying with batch size {batch_size}")
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+
     def split_text_into_sections(self, text):
         """Split a text into sentences using newline character."""
         return split_text_into_sections(text)
@@ -174,8 +534,6 @@ class RentalAnalysis:
         
         if document_metadata is None:
             document_metadata = {}
-            
-        results = []
         
         # Skip if no sentences
         if not sentences:
@@ -183,65 +541,54 @@ class RentalAnalysis:
                     "category": "fehlend", 
                     "description": "Das Dokument enthält keinen Text oder konnte nicht gelesen werden."}]
         
-        # Process each sentence
-        for sentence in sentences:
-            # Skip very short sentences
-            if len(sentence) < 40:
-                results.append({
-                            "text": sentence,
-                            "category": [],
-                            "description": ""
-                        })
-                continue
-                
+        # Embed all sentences that are long enough in a single batch
+        long_sentences = list(dict.fromkeys(sentence for sentence in sentences if len(sentence) >= MIN_SENTENCE_LENGTH))
+        analyzed = {}
+        if long_sentences:
             try:
-                sentence_embedding = self.model.encode([sentence])[0].tolist()
-                
-                # Search for similar clauses in the sample agreement
-                sample_results = self.sample_agreements.query(
-                    query_embeddings=[sentence_embedding],
-                    n_results=1
-                )
-                
-                # Search for similar clauses in the invalid clauses
-                invalid_results = self.invalid_clauses.query(
-                    query_embeddings=[sentence_embedding],
-                    n_results=1
-                )
-                
-                sample_distance = sample_results["distances"][0][0]
-                invalid_distance = invalid_results["distances"][0][0]
-                
-                closest_sample = sample_results["documents"][0][0]
-                closest_invalid = invalid_results["documents"][0][0]
-
-                                # Determine the category based on distances
-                category = []
-
-                if sample_distance > 4:
-                    category.append("unusual")
-                else:
-                    category.append("match_found")
-
-                if invalid_distance <= 4:
-                    category.append("invalid")
-                else:
-                    category.append("valid")
-
-                                
-                results.append({
-                    "text": sentence,
-                    "category": category,
-                    "description": "",
-                    "sample_distance": sample_distance,
-                    "closest_sample": closest_sample,
-                    "invalid_distance": invalid_distance,
-                    "closest_invalid": closest_invalid
-                })
-                
+                embeddings = self._encode(long_sentences)
+
+                # Search both collections for the whole document at once
+                sample_best, sample_distances = self._nearest(embeddings, self._sample_matrix, self._sample_norms)
+                invalid_best, invalid_distances = self._nearest(embeddings, self._invalid_matrix, self._invalid_norms)
+
+                # Determine the categories based on distances
+                unusual, invalid = self._classify(sample_distances, invalid_distances)
+                sample_categories = np.where(unusual, "unusual", "match_found").tolist()
+                invalid_categories = np.where(invalid, "invalid", "valid").tolist()
+
+                analyzed = {
+                    sentence: {
+                        "category": [sample_category, invalid_category],
+                        "description": "",
+                        "sample_distance": sample_distance,
+                        "closest_sample": self._sample_docs[sample_idx],
+                        "invalid_distance": invalid_distance,
+                        "closest_invalid": self._invalid_docs[invalid_idx]
+                    }
+                    for sentence, sample_category, invalid_category, sample_distance, sample_idx,
+                        invalid_distance, invalid_idx in zip(
+                        long_sentences, sample_categories, invalid_categories, sample_distances.tolist(),
+                        sample_best.tolist(), invalid_distances.tolist(), invalid_best.tolist())
+                }
             except Exception as e:
-                logger.error(f"Error analyzing sentence: {e}")
-                continue
+                logger.error(f"Error analyzing sentences: {e}")
+
+        # Build the results in document order; very short sentences are not analyzed
+        if INCLUDE_SHORT_SENTENCES:
+            results = [
+                {"text": sentence, "category": [], "description": ""}
+                if len(sentence) < MIN_SENTENCE_LENGTH else
+                {"text": sentence, **analyzed[sentence], "category": list(analyzed[sentence]["category"])}
+                for sentence in sentences
+                if len(sentence) < MIN_SENTENCE_LENGTH or sentence in analyzed
+            ]
+        else:
+            results = [
+                {"text": sentence, **analyzed[sentence], "category": list(analyzed[sentence]["category"])}
+                for sentence in sentences
+                if sentence in analyzed
+            ]
         
         # If no results were found, add a default entry
         if not results:
@@ -253,7 +600,7 @@ class RentalAnalysis:
         
         return results
     
-    def analyze_essentials(self, text):
+    async def analyze_essentials(self, text):
         """
         Analyze the essential contents of a rental agreement using OpenAI API.
         
@@ -272,60 +619,41 @@ class RentalAnalysis:
         logger.info("Analyzing essential contents of rental agreement")
         
         try:
-            # Define the prompt for OpenAI
-            prompt = """Bitte überprüfe den sogleich angegebenen Mietvertrag auf seine wesentlichen Vertragsinhalte und gebe die Ergebnisse in einem JSON-Format zurück. Die wesentlichen Vertragsinhalte eines Mietvertrags sind:
-                1. Die Vertragsparteien
-                2. Der Mietgegenstand
-                3. Die Miete
-                4. Der Mietbeginn
-
-                Falls einer dieser Punkte nicht genannt ist, gib den Wert als `null` zurück. Der JSON-Output soll wie folgt aussehen:
-
-                {
-                    "vertragsparteien": "<Vertragsparteien>",
-                    "mietgegenstand": "<Mietgegenstand>",
-                    "miete": "<Miete>",
-                    "mietbeginn": "<Mietbeginn>"
-                }
+            if self.openai_client is None:
+                raise RuntimeError("OPENAI_API_KEY is not set")
+
+            if len(text) > ESSENTIALS_MAX_CHARS:
+                logger.info(f"Truncating text from {len(text)} to {ESSENTIALS_MAX_CHARS} characters")
+                text = text[:ESSENTIALS_MAX_CHARS]
 
-                Mietvertrag:
-            """
-                        
-            # Make API call to OpenAI
-            response = openai.chat.completions.create(
-                model="gpt-4.1",
+            # Make API call to OpenAI, bounded by the overall timeout
+            response = await asyncio.wait_for(self.openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
                 messages=[
-                    {"role": "system", "content": "Du bist ein hilfreicher Assistent, der Mietverträge analysiert."},
-                    {"role": "user", "content": prompt + text}
+                    {"role": "system", "content": ESSENTIALS_SYSTEM_PROMPT},
+                    {"role": "user", "content": text}
                 ],
                 temperature=0.0,  # We want deterministic answers
-                max_completion_tokens=1000
-            )
-            response_text = response.choices[0].message.content
-
-            # Attempt to parse the response as JSON
-            try:
-                # Extract JSON from the response text if it's wrapped in ```json ... ``` blocks
-                if "```json" in response_text:
-                    json_start = response_text.find('```json') + 7
-                    json_end = response_text.rfind('```')
-                    json_str = response_text[json_start:json_end].strip()
-                    result = json.loads(json_str)
-                else:
-                    # Try direct parsing
-                    result = json.loads(response_text)
-                    
-                logger.info("Successfully parsed JSON response")
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON parse error: {e}")
-                result = {
-                    "error": "Invalid JSON response from OpenAI",
-                    "response": response_text
-                }
+                max_completion_tokens=1000,
+                # The API guarantees a JSON body matching the schema
+                response_format=ESSENTIALS_RESPONSE_FORMAT
+            ), timeout=OPENAI_TIMEOUT)
+            choice = response.choices[0]
+            if choice.finish_reason == "length":
+                # A reply cut off at the token limit is incomplete JSON
+                raise RuntimeError("OpenAI response was truncated at the completion token limit")
+            result = json.loads(choice.message.content)
             
             logger.info("Essential content analysis complete")
             return result
             
+        except asyncio.TimeoutError:
+            logger.error(f"OpenAI request timed out after {OPENAI_TIMEOUT} seconds")
+            return {
+                "analysis": "Fehler bei der Analyse der wesentlichen Vertragsinhalte.",
+                "status": "error",
+                "error": f"OpenAI request timed out after {OPENAI_TIMEOUT} seconds"
+            }
         except Exception as e:
             logger.error(f"Error analyzing essential contents: {e}")
             return {
@@ -334,5 +662,21 @@ class RentalAnalysis:
                 "error": str(e)
             }
 
-# Create a singleton instance
-analyzer = RentalAnalysis()
+# Singleton instance, created on first use so importing this module stays cheap
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+def get_analyzer():
+    """Return the shared RentalAnalysis instance, creating it on first use."""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = RentalAnalysis()
+    return _analyzer
+
+def __getattr__(name):
+    # Keep `from analysis.analysis import analyzer` working (PEP 562)
+    if name == "analyzer":
+        return get_analyzer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,77 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import numpy as np
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_CHUNK_SIZE = 500
+
+class EmbeddingCache:
+    """
+    A persistent cache for sentence embeddings backed by SQLite.
+    Embeddings are keyed by SHA-256(model name + NUL + text) and stored as float16.
+    """
+
+    def __init__(self, path, model_name):
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _key(self, text):
+        return hashlib.sha256((self.model_name + "\0" + text).encode("utf-8")).digest()
+
+    def get_many(self, texts):
+        """
+        Look up cached embeddings.
+
+        Args:
+            texts (list): Texts to look up
+
+        Returns:
+            dict: Mapping of text to its float32 embedding for every cache hit
+        """
+        keys = {self._key(text): text for text in texts}
+        key_list = list(keys)
+        found = {}
+        try:
+            with self._lock:
+                for start in range(0, len(key_list), _QUERY_CHUNK_SIZE):
+                    chunk = key_list[start:start + _QUERY_CHUNK_SIZE]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                    ).fetchall()
+                    for key, vector in rows:
+                        found[keys[key]] = np.frombuffer(vector, dtype=np.float16).astype(np.float32)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading embedding cache: {e}")
+        return found
+
+    def set_many(self, texts, embeddings):
+        """
+        Store embeddings in the cache.
+
+        Args:
+            texts (list): Texts that were embedded
+            embeddings: Embeddings in the same order as texts
+        """
+        # Convert the whole matrix once instead of every row separately
+        matrix = np.asarray(embeddings, dtype=np.float16)
+        rows = [(self._key(text), vector.tobytes()) for text, vector in zip(texts, matrix)]
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error writing embedding cache: {e}")
@@ -0,0 +1,103 @@
+import os
+import logging
+import numpy as np
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class OnnxSentenceEncoder:
+    """
+    A drop-in replacement for SentenceTransformer.encode() that runs an
+    int8-quantized ONNX export of the model through ONNX Runtime.
+    Applies the same mean pooling as the original sentence-transformers model.
+    """
+
+    def __init__(self, model_dir, model_file="model_int8.onnx", max_seq_length=128):
+        # Imported here so the optional dependencies are only needed with USE_ONNX=1
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        providers = [
+            provider for provider in ("CUDAExecutionProvider", "CPUExecutionProvider")
+            if provider in onnxruntime.get_available_providers()
+        ]
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, model_file), providers=providers)
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.max_seq_length = max_seq_length
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+        logger.info(f"Loaded ONNX model from {model_dir} using {providers[0]}")
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, show_progress_bar=False,
+               normalize_embeddings=False, device=None):
+        """
+        Embed a list of sentences.
+
+        Args:
+            sentences (list): Sentences to embed
+            batch_size (int): Number of sentences per inference run
+            normalize_embeddings (bool): L2-normalize the returned embeddings
+            device: Ignored; the execution provider is chosen when the session is created
+
+        Returns:
+            numpy.ndarray: Embeddings of shape (len(sentences), dimension)
+        """
+        if not sentences:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        # Sort by length so each batch is padded only to its own longest sentence
+        order = np.argsort([-len(sentence) for sentence in sentences], kind="stable")
+        embeddings = np.empty((len(sentences), self.dimension), dtype=np.float32)
+
+        for start in range(0, len(sentences), batch_size):
+            batch_idx = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [sentences[i] for i in batch_idx],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            inputs = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+            token_embeddings = self.session.run(None, inputs)[0]
+
+            # Mean pooling over the non-padding tokens
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            embeddings[batch_idx] = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+def export_quantized_model(model_name, output_dir):
+    """
+    Export a sentence-transformers model to ONNX and quantize it to int8.
+
+    Args:
+        model_name (str): Hugging Face model name
+        output_dir (str): Directory for the tokenizer, model.onnx and model_int8.onnx
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from transformers import AutoTokenizer
+
+    ORTModelForFeatureExtraction.from_pretrained(model_name, export=True).save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+    quantize_dynamic(
+        os.path.join(output_dir, "model.onnx"),
+        os.path.join(output_dir, "model_int8.onnx"),
+        weight_type=QuantType.QInt8
+    )
+    logger.info(f"Exported quantized ONNX model to {output_dir}")
+
+if __name__ == "__main__":
+    # Usage: python -m analysis.onnx_encoder <model_name> <output_dir>
+    import sys
+
+    export_quantized_model(sys.argv[1], sys.argv[2])
@@ -0,0 +1,49 @@
+from typing import List, Optional
+from pydantic import BaseModel, ConfigDict
+
+# Pydantic models for the API responses
+class Category(str):
+    FEHLEND = "fehlend"
+    UNGEWOEHNLICH = "ungewöhnlich"
+    NICHTIG = "nichtig"
+
+class AnalysisItem(BaseModel):
+    # Drop the distance details from the analysis results in the response
+    model_config = ConfigDict(extra='ignore')
+
+    text: str
+    category: Optional[List[str]] = []
+    description: str
+
+class EssentialsResponse(BaseModel):
+    vertragsparteien: Optional[str] = None
+    mietgegenstand: Optional[str] = None
+    miete: Optional[str] = None
+    mietbeginn: Optional[str] = None
+
+class UploadResponse(BaseModel):
+    id: str
+    message: str
+
+class AnalysisResponse(BaseModel):
+    id: str
+    results: List[AnalysisItem]
+    essentials: Optional[EssentialsResponse] = None
+
+class SearchResult(BaseModel):
+    text: str
+    similarity: float
+    category: str
+
+class SearchResponse(BaseModel):
+    query: str
+    invalid_clauses: List[SearchResult]
+    sample_clauses: List[SearchResult]
+
+class UploadedDocument(BaseModel):
+    id: str
+    filename: str
+    upload_date: str
+
+class UploadedDocumentsList(BaseModel):
+    documents: List[UploadedDocument]
@@ -1,28 +1,46 @@
 import os
+import asyncio
+import hashlib
+import functools
 import uuid
 import logging
-import json
-from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import orjson
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse
 import uvicorn
 from datetime import datetime
+from pathlib import Path
+from contextlib import asynccontextmanager
 
 # Import the rental analysis module
-from analysis.analysis import analyzer as rental_analyzer
+from analysis.analysis import get_analyzer
 # Import utility functions
-from utils.file_utils import extract_text, save_results_to_json
+from utils.file_utils import extract_text
+from utils.analysis_store import AnalysisStore
+# Import the API schemas
+from api.schemas import UploadResponse, AnalysisResponse
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app):
+    """Load the embedding model and collections before serving requests"""
+    # Analyses left pending by a previous process will never finish
+    stale = await asyncio.to_thread(ANALYSES.fail_stale)
+    if stale:
+        logger.info(f"Marked {stale} stale pending analyses as failed")
+    await asyncio.to_thread(get_analyzer)
+    yield
+
 # Create the FastAPI app
 app = FastAPI(
     title="Legal Document Analysis API",
     description="API for analyzing legal documents",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -34,59 +52,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Temporary storage for demonstration
-# In a real app, this would be a database
-UPLOADS_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
-ANALYSES = {}
+BASE_DIR = Path(__file__).resolve().parent
+UPLOADS_FOLDER = BASE_DIR / 'uploads'
+# Analyses saved as JSON files by earlier versions are still served from here
+RESULTS_FOLDER = BASE_DIR / 'analysis_results'
 
 # Create folders if they don't exist
-os.makedirs(UPLOADS_FOLDER, exist_ok=True)
-RESULTS_FOLDER = os.path.join(os.path.dirname(__file__), 'analysis_results')
-os.makedirs(RESULTS_FOLDER, exist_ok=True)
-
-# Define Pydantic models for responses
-class Category(str):
-    FEHLEND = "fehlend"
-    UNGEWOEHNLICH = "ungewöhnlich"
-    NICHTIG = "nichtig"
-
-class AnalysisItem(BaseModel):
-    text: str
-    category: Optional[List[str]] = []
-    description: str
-
-class EssentialsResponse(BaseModel):
-    vertragsparteien: Optional[str]
-    mietgegenstand: Optional[str]
-    miete: Optional[str]
-    mietbeginn: Optional[str]
-
-class UploadResponse(BaseModel):
-    id: str
-    message: str
-
-class AnalysisResponse(BaseModel):
-    id: str
-    results: List[AnalysisItem]
-    essentials: Optional[EssentialsResponse] = None
-
-class SearchResult(BaseModel):
-    text: str
-    similarity: float
-    category: str
-
-class SearchResponse(BaseModel):
-    query: str
-    invalid_clauses: List[SearchResult]
-    sample_clauses: List[SearchResult]
-
-class UploadedDocument(BaseModel):
-    id: str
-    filename: str
-    upload_date: str
-
-class UploadedDocumentsList(BaseModel):
-    documents: List[UploadedDocument]
+for folder in (UPLOADS_FOLDER, RESULTS_FOLDER):
+    folder.mkdir(exist_ok=True)
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Analyses are stored in SQLite, shared by all server workers
+ANALYSES = AnalysisStore(RESULTS_FOLDER / 'analyses.sqlite3')
 
 def analyze_legal_text(text):
     """
@@ -94,6 +72,8 @@ def analyze_legal_text(text):
     Uses the rental agreement analyzer for more sophisticated analysis
     """
     try:
+        rental_analyzer = get_analyzer()
+
         # Split text into sentences
         sentences = rental_analyzer.split_text_into_sections(text)
         
@@ -120,14 +100,14 @@ def analyze_legal_text(text):
         
         return results
 
-def analyze_essentials(text):
+async def analyze_essentials(text):
     """
     Analyze the essential contents of a rental agreement
     Uses the rental analyzer to call OpenAI API
     """
     try:
         # Use the rental agreement analyzer for essentials analysis
-        results = rental_analyzer.analyze_essentials(text)
+        results = await get_analyzer().analyze_essentials(text)
         
         # Log analysis results
         logger.info(f"Essentials analysis complete")
@@ -143,10 +123,40 @@ def analyze_essentials(text):
             "error": str(e)
         }
 
+def _save_upload(file, file_path):
+    """Copy an uploaded file to disk in chunks and return the SHA-256 of its contents"""
+    digest = hashlib.sha256()
+    with open(file_path, "wb") as f:
+        while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+async def _run_analysis(analysis_id, file_path):
+    """Analyze an uploaded file and store the results"""
+    try:
+        # Extract text from the document; parsing and OCR are blocking
+        extracted_text = await asyncio.to_thread(extract_text, str(file_path))
+        
+        # Analyze the sentences (in a worker thread) and the essentials (OpenAI) concurrently
+        results, essentials = await asyncio.gather(
+            asyncio.to_thread(analyze_legal_text, extracted_text),
+            analyze_essentials(extracted_text)
+        )
+        
+        # Save the results; failed essentials are not reused so the next upload retries them
+        await asyncio.to_thread(
+            ANALYSES.complete, analysis_id, results, essentials, essentials.get("status") != "error"
+        )
+        logger.info(f"Analysis {analysis_id} complete")
+    except Exception as e:
+        logger.error(f"Error analyzing file {file_path}: {e}")
+        await asyncio.to_thread(ANALYSES.fail, analysis_id)
+
 # API endpoints
-@app.post("/api/upload", response_model=UploadResponse, status_code=201)
-async def upload_document(file: UploadFile = File(...)):
-    """Upload a document and generate a UUID for it"""
+@app.post("/api/upload", response_model=UploadResponse, status_code=202)
+async def upload_document(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    """Upload a document, generate a UUID for it and queue its analysis"""
     if not file:
         raise HTTPException(status_code=400, detail="No file part")
     
@@ -157,60 +167,55 @@ async def upload_document(file: UploadFile = File(...)):
     analysis_id = str(uuid.uuid4())
     
     # Save the file
-    file_path = os.path.join(UPLOADS_FOLDER, f"{analysis_id}_{file.filename}")
+    file_path = UPLOADS_FOLDER / f"{analysis_id}_{file.filename}"
     
     try:
-        # Save uploaded file
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        # Extract text from the document
-        extracted_text = extract_text(file_path)
-        
-        # Analyze the text
-        results = analyze_legal_text(extracted_text)
-
-        essentials = analyze_essentials(extracted_text)
-        
-        # Format and save the results
-        analysis_response = {
-            "id": analysis_id,
-            "results": results,
-            "essentials": essentials
-        }
-        
-        # Store results for API access
-        ANALYSES[analysis_id] = analysis_response
-        
-        # Save to JSON file
-        json_path = os.path.join(RESULTS_FOLDER, f"analysis_{analysis_id}.json")
-        save_results_to_json(json_path, analysis_response)
+        # Save uploaded file, streaming it in chunks off the event loop
+        content_hash = await asyncio.to_thread(_save_upload, file, file_path)
+
+        # Reuse the analysis of an identical earlier upload
+        existing_id = await asyncio.to_thread(ANALYSES.find_by_content_hash, content_hash)
+        if existing_id is not None:
+            logger.info(f"Upload matches analysis {existing_id}, skipping analysis")
+            file_path.unlink()
+            return {"id": existing_id, "message": "File uploaded successfully"}
+
+        # Analyze the file after the response has been sent
+        await asyncio.to_thread(ANALYSES.create, analysis_id, file.filename, content_hash)
+        background_tasks.add_task(_run_analysis, analysis_id, file_path)
         
-        return {"id": analysis_id, "message": "File uploaded successfully"}
+        return {"id": analysis_id, "message": "File uploaded successfully, analysis queued"}
     
     except Exception as e:
         logger.error(f"Error processing file: {e}")
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
+@functools.lru_cache(maxsize=1024)
+def _load_analysis(file_path, mtime_ns):
+    """Read a saved analysis; a newer modification time invalidates the cached entry"""
+    with open(file_path, 'rb') as f:
+        return orjson.loads(f.read())
+
 @app.get("/api/analysis/{analysis_id}", response_model=AnalysisResponse)
 async def get_analysis(analysis_id: str):
-    """Get analysis results by ID directly from the saved JSON file"""
-    # Construct the file path
-    file_path = os.path.join(RESULTS_FOLDER, f"analysis_{analysis_id}.json")
-    
-    # Check if file exists
-    if not os.path.exists(file_path):
-        # Fallback to in-memory cache
-        if analysis_id in ANALYSES:
-            analysis = ANALYSES[analysis_id]
-        else:
+    """Get analysis results by ID from the analysis store"""
+    # SQLite can block on the write lock, so query the store off the event loop
+    analysis = await asyncio.to_thread(ANALYSES.get, analysis_id)
+    if analysis is not None and analysis["status"] == "pending":
+        # Tell the client to poll again until the background analysis is done
+        return JSONResponse(status_code=202, content={"id": analysis_id, "status": "pending"})
+    if analysis is not None and analysis["status"] == "error":
+        raise HTTPException(status_code=500, detail="Analysis failed")
+    if analysis is None:
+        # Fall back to the JSON files written by earlier versions
+        file_path = RESULTS_FOLDER / f"analysis_{analysis_id}.json"
+        try:
+            mtime_ns = file_path.stat().st_mtime_ns
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="Analysis not found")
-    else:
         try:
-            # Read analysis from file
-            with open(file_path, 'r', encoding='utf-8') as f:
-                analysis = json.load(f)
+            # Read analysis from file, or from memory if the file is unchanged
+            analysis = _load_analysis(file_path, mtime_ns)
         except Exception as e:
             logger.error(f"Error reading analysis file {file_path}: {e}")
             raise HTTPException(status_code=500, detail=f"Error reading analysis file: {str(e)}")
@@ -222,4 +227,18 @@ async def get_analysis(analysis_id: str):
     }
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # For local development; spawned worker processes re-run this script, so production
+    # deployments start the app with the uvicorn CLI instead
+    if os.getenv("DEBUG") == "1":
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        # A single worker by default: every worker loads its own model and builds the Chroma
+        # collections at startup, which is not safe to run in several processes at once
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            loop="uvloop",
+            http="httptools",
+            workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+        ) 
\ No newline at end of file
@@ -0,0 +1,47 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from analysis.analysis import RentalAnalysis
+
+ESSENTIALS = {
+    "vertragsparteien": "Max Mustermann (Vermieter), Erika Musterfrau (Mieterin)",
+    "mietgegenstand": "Wohnung, Musterstraße 1",
+    "miete": "800 EUR",
+    "mietbeginn": "01.01.2023",
+}
+
+class FakeCompletions:
+    """Returns a fixed chat completion and records the request arguments"""
+
+    def __init__(self, content, finish_reason):
+        self.content = content
+        self.finish_reason = finish_reason
+        self.kwargs = None
+
+    async def create(self, **kwargs):
+        self.kwargs = kwargs
+        message = SimpleNamespace(content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=self.finish_reason)])
+
+def _analyzer(completions):
+    # Skip __init__ so no model or Chroma collection is loaded
+    analyzer = RentalAnalysis.__new__(RentalAnalysis)
+    analyzer.openai_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return analyzer
+
+def test_analyze_essentials_returns_parsed_reply():
+    completions = FakeCompletions(json.dumps(ESSENTIALS), "stop")
+
+    result = asyncio.run(_analyzer(completions).analyze_essentials("Mietvertrag"))
+
+    assert result == ESSENTIALS
+    assert completions.kwargs["max_completion_tokens"] == 1000
+
+def test_analyze_essentials_reports_truncated_reply():
+    completions = FakeCompletions(json.dumps(ESSENTIALS)[:40], "length")
+
+    result = asyncio.run(_analyzer(completions).analyze_essentials("Mietvertrag"))
+
+    assert result["status"] == "error"
+    assert "truncated" in result["error"]
@@ -0,0 +1,66 @@
+from utils.analysis_store import AnalysisStore
+
+def test_running_analysis_is_reused(tmp_path):
+    store = AnalysisStore(tmp_path / "analyses.sqlite3", pending_timeout=60)
+    store.create("running", "vertrag.pdf", "deadbeef")
+
+    assert store.find_by_content_hash("deadbeef") == "running"
+    assert store.get("running")["status"] == "pending"
+
+def test_stale_pending_analysis_is_failed(tmp_path):
+    # With no timeout every pending analysis counts as lost with its worker
+    store = AnalysisStore(tmp_path / "analyses.sqlite3", pending_timeout=0)
+    store.create("stale", "vertrag.pdf", "deadbeef")
+
+    assert store.find_by_content_hash("deadbeef") is None
+    assert store.get("stale")["status"] == "error"
+
+    assert store.fail_stale() == 1
+    assert store.get("stale")["status"] == "error"
+    assert store.fail_stale() == 0
+
+def test_complete_stores_results(tmp_path):
+    store = AnalysisStore(tmp_path / "analyses.sqlite3")
+    store.create("done", "vertrag.pdf", "deadbeef")
+    results = [{"text": "§1 Mietsache", "category": ["valid"], "description": ""}]
+    essentials = {"vertragsparteien": None, "mietgegenstand": None, "miete": "800 EUR", "mietbeginn": None}
+
+    store.complete("done", results, essentials)
+
+    assert store.get("done") == {"id": "done", "status": "done", "results": results, "essentials": essentials}
+    assert store.find_by_content_hash("deadbeef") == "done"
+
+def test_unreusable_result_is_not_found_by_hash(tmp_path):
+    store = AnalysisStore(tmp_path / "analyses.sqlite3")
+    store.create("partial", "vertrag.pdf", "deadbeef")
+
+    store.complete("partial", [], {"status": "error"}, reusable=False)
+
+    assert store.get("partial")["status"] == "done"
+    assert store.find_by_content_hash("deadbeef") is None
+
+def test_failed_analysis_is_not_reused(tmp_path):
+    store = AnalysisStore(tmp_path / "analyses.sqlite3")
+    store.create("failed", "vertrag.pdf", "deadbeef")
+
+    store.fail("failed")
+
+    assert store.get("failed")["status"] == "error"
+    assert store.find_by_content_hash("deadbeef") is None
+
+def test_newest_matching_analysis_is_reused(tmp_path, monkeypatch):
+    store = AnalysisStore(tmp_path / "analyses.sqlite3")
+    monkeypatch.setattr("utils.analysis_store.time.time", lambda: 1000)
+    store.create("old", "vertrag.pdf", "deadbeef")
+    store.complete("old", [], {})
+    monkeypatch.setattr("utils.analysis_store.time.time", lambda: 2000)
+    store.create("new", "vertrag.pdf", "deadbeef")
+    store.complete("new", [], {})
+
+    assert store.find_by_content_hash("deadbeef") == "new"
+
+def test_unknown_analysis(tmp_path):
+    store = AnalysisStore(tmp_path / "analyses.sqlite3")
+
+    assert store.get("missing") is None
+    assert store.find_by_content_hash("deadbeef") is None
@@ -0,0 +1,32 @@
+import numpy as np
+
+from analysis.embedding_cache import EmbeddingCache
+
+def test_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embedding_cache.sqlite3"), "model")
+    texts = ["Die Miete beträgt 800 EUR.", "Der Mieter trägt die Nebenkosten."]
+    embeddings = np.random.default_rng(0).standard_normal((2, 384)).astype(np.float32)
+
+    cache.set_many(texts, embeddings)
+    found = cache.get_many(texts + ["Nicht im Cache."])
+
+    assert set(found) == set(texts)
+    for text, embedding in zip(texts, embeddings):
+        assert found[text].dtype == np.float32
+        # Stored as float16
+        np.testing.assert_allclose(found[text], embedding, rtol=1e-3, atol=1e-3)
+
+def test_entries_are_scoped_to_the_model(tmp_path):
+    path = str(tmp_path / "embedding_cache.sqlite3")
+    EmbeddingCache(path, "model-a").set_many(["Mietbeginn"], np.ones((1, 4), dtype=np.float32))
+
+    assert EmbeddingCache(path, "model-b").get_many(["Mietbeginn"]) == {}
+    assert set(EmbeddingCache(path, "model-a").get_many(["Mietbeginn"])) == {"Mietbeginn"}
+
+def test_many_texts_are_looked_up_in_chunks(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embedding_cache.sqlite3"), "model")
+    texts = [f"Satz {i}" for i in range(1200)]
+
+    cache.set_many(texts, np.zeros((len(texts), 4), dtype=np.float32))
+
+    assert len(cache.get_many(texts)) == len(texts)
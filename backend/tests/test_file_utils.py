@@ -0,0 +1,36 @@
+import re
+
+import nltk
+import pytest
+
+from utils import file_utils
+
+def _punkt_available():
+    try:
+        nltk.data.find("tokenizers/punkt_tab")
+    except LookupError:
+        return False
+    return file_utils.sent_tokenize is not None
+
+TEXT = (
+    "§ 1 Mietsache\n"
+    "\n"
+    "Der Vermieter vermietet dem Mieter die Wohnung im 2. OG links.\n"
+    "Die Miete beträgt z.B. 800 EUR!' Nebenkosten werden gesondert abgerechnet...!)(Anlage 1)\n"
+    "Mietbeginn 01.01.2023\n"
+    "Unterschrift Vermieter\n"
+    "Ist die Kaution fällig? Ja.\n"
+)
+
+@pytest.mark.skipif(not _punkt_available(), reason="NLTK punkt tokenizer not available")
+def test_fast_path_matches_sent_tokenize(monkeypatch):
+    fast = file_utils.split_text_into_sections(TEXT)
+    # A pattern that matches everything sends every paragraph to NLTK
+    monkeypatch.setattr(file_utils, "_SENTENCE_BOUNDARY_CANDIDATE", re.compile(""))
+
+    assert file_utils.split_text_into_sections(TEXT) == fast
+
+def test_blank_lines_are_kept():
+    sections = file_utils.split_text_into_sections("Mietvertrag\n\nUnterschrift")
+
+    assert sections == ["Mietvertrag\n", "\n\n", "Unterschrift\n"]
@@ -0,0 +1,149 @@
+import sqlite3
+import threading
+import time
+import orjson
+
+# Background analyses do not survive a worker restart; pending rows older than this are failed
+PENDING_TIMEOUT = 15 * 60
+
+class AnalysisStore:
+    """
+    Persistent storage for document analyses backed by SQLite.
+    The database runs in WAL mode so several server workers can read while one writes.
+    """
+
+    def __init__(self, path, pending_timeout=PENDING_TIMEOUT):
+        self.pending_timeout = pending_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS analyses (
+                id TEXT PRIMARY KEY,
+                filename TEXT,
+                upload_date INTEGER NOT NULL,
+                content_hash TEXT,
+                results_json BLOB NOT NULL,
+                essentials_json BLOB,
+                status TEXT NOT NULL DEFAULT 'done'
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS analyses_upload_date ON analyses (upload_date)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS analyses_content_hash ON analyses (content_hash)")
+        self._conn.commit()
+
+    def create(self, analysis_id, filename, content_hash=None):
+        """
+        Register a pending analysis for an uploaded file.
+
+        Args:
+            analysis_id (str): ID of the analysis
+            filename (str): Name of the uploaded file
+            content_hash (str, optional): Hash of the uploaded file
+        """
+        # upload_date doubles as the start time of the analysis
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO analyses (id, filename, upload_date, content_hash, results_json, status) "
+                "VALUES (?, ?, ?, ?, ?, 'pending')",
+                (analysis_id, filename, int(time.time()), content_hash, orjson.dumps([]))
+            )
+            self._conn.commit()
+
+    def complete(self, analysis_id, results, essentials, reusable=True):
+        """
+        Store the results of a pending analysis.
+
+        Args:
+            analysis_id (str): ID of the analysis
+            results (list): Analysis results for the sentences of the document
+            essentials (dict): Essential contents of the rental agreement
+            reusable (bool): Whether uploads of the same file may reuse this analysis
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE analyses SET status = 'done', results_json = ?, essentials_json = ?, "
+                "content_hash = CASE WHEN ? THEN content_hash END WHERE id = ?",
+                (orjson.dumps(results, option=orjson.OPT_SERIALIZE_NUMPY), orjson.dumps(essentials),
+                 reusable, analysis_id)
+            )
+            self._conn.commit()
+
+    def fail(self, analysis_id):
+        """
+        Mark a pending analysis as failed so it is never reused.
+
+        Args:
+            analysis_id (str): ID of the analysis
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE analyses SET status = 'error', content_hash = NULL WHERE id = ?", (analysis_id,)
+            )
+            self._conn.commit()
+
+    def fail_stale(self):
+        """
+        Mark pending analyses that outlived the pending timeout as failed.
+
+        Returns:
+            int: Number of analyses marked as failed
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE analyses SET status = 'error', content_hash = NULL "
+                "WHERE status = 'pending' AND upload_date <= ?",
+                (self._pending_cutoff(),)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def _pending_cutoff(self):
+        return int(time.time()) - self.pending_timeout
+
+    def get(self, analysis_id):
+        """
+        Look up an analysis.
+
+        Args:
+            analysis_id (str): ID of the analysis
+
+        Returns:
+            dict: The analysis with id, status, results and essentials, or None if it does not exist
+        """
+        with self._lock:
+            # A pending analysis older than the timeout was lost with its worker
+            row = self._conn.execute(
+                "SELECT CASE WHEN status = 'pending' AND upload_date <= ? THEN 'error' ELSE status END, "
+                "results_json, essentials_json FROM analyses WHERE id = ?",
+                (self._pending_cutoff(), analysis_id)
+            ).fetchone()
+        if row is None:
+            return None
+        status, results_json, essentials_json = row
+        return {
+            "id": analysis_id,
+            "status": status,
+            "results": orjson.loads(results_json),
+            "essentials": orjson.loads(essentials_json) if essentials_json is not None else None
+        }
+
+    def find_by_content_hash(self, content_hash):
+        """
+        Find a reusable analysis of a file with the same contents.
+
+        Args:
+            content_hash (str): Hash of the uploaded file
+
+        Returns:
+            str: ID of the most recent matching analysis that is done or still running, or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM analyses WHERE content_hash = ? "
+                "AND (status = 'done' OR (status = 'pending' AND upload_date > ?)) "
+                "ORDER BY upload_date DESC LIMIT 1",
+                (content_hash, self._pending_cutoff())
+            ).fetchone()
+        return row[0] if row is not None else None
@@ -1,10 +1,10 @@
 import os
 import logging
-import PyPDF2
-import docx
-import pytesseract
-from PIL import Image
-import json
+import mmap
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import chain
 import re
 import nltk
 
@@ -12,78 +12,209 @@ import nltk
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Use PDFium's native text extraction when available
+try:
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+except ImportError:
+    logger.warning("pypdfium2 not installed, falling back to PyPDF2 for PDF extraction")
+    pdfium = None
+
+# Tesseract runtime grows with the pixel count, so larger images are downscaled first
+OCR_MAX_DIMENSION = 2000
+# Rental agreements are German; a fixed language skips Tesseract's language handling
+OCR_LANGUAGE = "deu"
+OCR_CONFIG = "--oem 1 --psm 6"
+# Maximum number of Tesseract processes a server process runs at once, shared by all its
+# requests; PDF worker processes split the same limit between them
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", str(os.cpu_count() or 1)))
+_ocr_executor = ThreadPoolExecutor(max_workers=OCR_CONCURRENCY, thread_name_prefix="ocr")
+
+# PDFs with at least this many pages are extracted by PDF_WORKERS processes in parallel
+PDF_PARALLEL_MIN_PAGES = 64
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+_pdf_executor = None
+_pdf_executor_lock = threading.Lock()
+
 # Download and set up NLTK resources
 try:
-    nltk.download('punkt', quiet=True)
+    try:
+        # The Docker image preinstalls the tokenizer under NLTK_DATA
+        nltk.data.find('tokenizers/punkt_tab')
+    except LookupError:
+        nltk.download('punkt_tab', quiet=True)
     from nltk.tokenize import sent_tokenize
     logger.info("Loaded NLTK punkt tokenizer for sentence detection")
 except Exception as e:
     logger.error(f"Error loading NLTK resources: {e}")
     sent_tokenize = None
 
+# Punkt only ends sentences at '.', '?' or '!'; paragraphs without any of them are a single sentence
+_SENTENCE_BOUNDARY_CANDIDATE = re.compile(r'[.?!]')
+
 def split_text_into_sections(text):
     """Split German text into sentences using NLTK's sentence tokenizer.
     This properly handles German sentence boundaries and preserves punctuation."""
     if not text or not text.strip():
         return []
-    
     result = []
     
     # Split the text by newlines to preserve paragraph structure
-    paragraphs = text.split('\n')
-    
-    for paragraph in paragraphs:
-        if not paragraph.strip():
+    for paragraph in text.split('\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
             # Keep empty lines as separate entries
             result.append("\n\n")
             continue
         
         # If NLTK tokenizer is available, use it for sentence detection
         if sent_tokenize is not None:
+            # Fast path: nothing for the tokenizer to split
+            if _SENTENCE_BOUNDARY_CANDIDATE.search(paragraph) is None:
+                result.append(paragraph + "\n")
+                continue
             try:
                 # Use NLTK to split the paragraph into sentences
                 # Setting language to German for proper sentence boundary detection
-                sentences = sent_tokenize(paragraph, language='german')
+                sentences = [sentence.strip() for sentence in sent_tokenize(paragraph, language='german')]
+                sentences = [sentence for sentence in sentences if sentence]
                 if sentences:
-                    # Add all sentences except the last one
-                    for sentence in sentences[:-1]:
-                        if sentence.strip():
-                            result.append(sentence.strip())
-                    
                     # For the last sentence, append a newline character
-                    if sentences[-1].strip():
-                        result.append(sentences[-1].strip() + "\n")
+                    sentences[-1] += "\n"
+                    result.extend(sentences)
             except Exception as e:
                 logger.error(f"Error in NLTK sentence splitting: {e}")
                 # If a sentence couldn't be properly split, add the whole paragraph
-                if paragraph.strip():
-                    result.append(paragraph.strip() + "\n")
+                result.append(paragraph + "\n")
     
     return result
 
+def _join_paragraphs(page_text):
+    """Merge the lines of a page into paragraphs, adding one backslash-n after each paragraph."""
+    paragraphs = []
+    lines = []
+    for line in page_text.split('\n'):
+        stripped_line = line.strip()
+        if stripped_line:
+            lines.append(stripped_line)
+        else:
+            # End of paragraph
+            paragraphs.append(" ".join(lines))
+            lines = []
+    if lines:
+        paragraphs.append(" ".join(lines))  # Last paragraph if no empty line at end
+    return "".join(paragraph + "\n" for paragraph in paragraphs)
+
+def _render_pdf_page(page):
+    """Render a PDF page so that its longer side is OCR_MAX_DIMENSION pixels"""
+    scale = OCR_MAX_DIMENSION / max(page.get_size())
+    return page.render(scale=scale, grayscale=True).to_pil()
+
+def _has_images(page):
+    """Check whether a PDF page contains image objects that OCR could read"""
+    return next(page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE,)), None) is not None
+
+def _read_pdf_pages(pdf, start, stop):
+    """Read the text of pages [start, stop), returning pending OCR results for scanned pages"""
+    pages = []
+    for index in range(start, stop):
+        page = pdf[index]
+        textpage = page.get_textpage()
+        page_text = textpage.get_text_range()
+        textpage.close()
+        if page_text.strip():
+            pages.append(page_text)
+        elif _has_images(page):
+            # Scanned pages: render here (PDFium is not thread-safe) and OCR concurrently
+            pages.append(_ocr_executor.submit(_ocr_image, _render_pdf_page(page)))
+        # Pages with neither text nor images are blank and skipped
+        page.close()
+
+    ocr_pages = sum(not isinstance(page_text, str) for page_text in pages)
+    if ocr_pages:
+        logger.info(f"Running OCR on {ocr_pages} scanned pages")
+    return pages
+
+def _extract_pdf_page_range(file_path, start, stop):
+    """Extract the texts of pages [start, stop) of a PDF file; runs in a worker process"""
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        pages = _read_pdf_pages(pdf, start, stop)
+    finally:
+        pdf.close()
+    return [page_text if isinstance(page_text, str) else page_text.result() for page_text in pages]
+
+def _init_pdf_worker(ocr_concurrency):
+    """Limit the OCR threads of a PDF worker process to its share of OCR_CONCURRENCY"""
+    global _ocr_executor
+    _ocr_executor = ThreadPoolExecutor(max_workers=ocr_concurrency, thread_name_prefix="ocr")
+
+def _get_pdf_executor():
+    """Start the PDF worker processes on first use"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            # Spawn instead of fork so the workers do not inherit the loaded model. Spawned
+            # workers re-import the started script, so this only stays cheap under the uvicorn CLI
+            _pdf_executor = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_pdf_worker,
+                initargs=(max(1, OCR_CONCURRENCY // PDF_WORKERS),)
+            )
+        return _pdf_executor
+
+def _extract_text_from_pdf_pdfium(file_path):
+    """Extract text from a PDF file with PDFium, adding one backslash-n after each paragraph."""
+    # Page texts, or pending OCR results for pages without a text layer
+    pages = None
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        page_count = len(pdf)
+        if page_count < PDF_PARALLEL_MIN_PAGES or PDF_WORKERS < 2:
+            pages = _read_pdf_pages(pdf, 0, page_count)
+    finally:
+        pdf.close()
+
+    if pages is None:
+        # PDFium is not thread-safe, so large documents are split across processes
+        chunk_size = -(-page_count // PDF_WORKERS)
+        executor = _get_pdf_executor()
+        futures = [
+            executor.submit(_extract_pdf_page_range, file_path, start, min(start + chunk_size, page_count))
+            for start in range(0, page_count, chunk_size)
+        ]
+        pages = list(chain.from_iterable(future.result() for future in futures))
+
+    parts = []
+    for page_text in pages:
+        if not isinstance(page_text, str):
+            page_text = page_text.result()
+        if page_text:
+            parts.append(_join_paragraphs(page_text.replace('\r\n', '\n').replace('\r', '\n')))
+    return "".join(parts)
+
 def extract_text_from_pdf(file_path):
     """Extract text from a PDF file, adding one backslash-n after each paragraph."""
-    text = ""
+    if pdfium is not None:
+        try:
+            return _extract_text_from_pdf_pdfium(file_path)
+        except Exception as e:
+            logger.error(f"Error extracting text from PDF with PDFium, falling back to PyPDF2: {e}")
+
     try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                page_text = page.extract_text()
+        # Only needed when PDFium is unavailable or fails
+        import PyPDF2
 
+        # Map the file so PyPDF2's many small seeks hit the page cache instead of Python file reads
+        with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            pdf_reader = PyPDF2.PdfReader(mapped)
+            parts = []
+            for page in pdf_reader.pages:
+                page_text = page.extract_text()
                 if page_text:
-                    lines = page_text.split('\n')
-                    paragraph = ""
-                    for line in lines:
-                        stripped_line = line.strip()
-                        if stripped_line:
-                            paragraph += stripped_line + " "
-                        else:
-                            # End of paragraph
-                            text += paragraph.strip() + "\n"
-                            paragraph = ""
-                    if paragraph:
-                        text += paragraph.strip() + "\n"  # Last paragraph if no empty line at end
+                    parts.append(_join_paragraphs(page_text))
+            text = "".join(parts)
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {e}")
         text = f"Error extracting text: {str(e)}"
@@ -91,56 +222,77 @@ def extract_text_from_pdf(file_path):
 
 def extract_text_from_docx(file_path):
     """Extract text from a DOCX file, preserving empty lines"""
-    text = ""
     try:
+        import docx
+
         doc = docx.Document(file_path)
-        for para in doc.paragraphs:
-            if para.text.strip() == "":
-                text += "\n"  # Represent empty paragraph by an extra newline
-            else:
-                text += para.text.strip() + "\n"
+        # Represent empty paragraphs by an extra newline
+        text = "".join(para.text.strip() + "\n" for para in doc.paragraphs)
     except Exception as e:
         logger.error(f"Error extracting text from DOCX: {e}")
         text = f"Error extracting text: {str(e)}"
     return text
 
+def _ocr_image(image):
+    """Run OCR on a single image after downscaling it to OCR_MAX_DIMENSION and converting it to grayscale"""
+    import pytesseract
+    from PIL import Image
+
+    if max(image.size) > OCR_MAX_DIMENSION:
+        image.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.Resampling.LANCZOS)
+    return pytesseract.image_to_string(image.convert("L"), lang=OCR_LANGUAGE, config=OCR_CONFIG)
+
 def extract_text_from_image(file_path):
     """Extract text from an image using OCR"""
     text = ""
     try:
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image)
+        from PIL import Image
+
+        with Image.open(file_path) as image:
+            frame_count = getattr(image, "n_frames", 1)
+            if frame_count == 1 and max(image.size) <= OCR_MAX_DIMENSION:
+                # Image.open() only read the header; let Tesseract decode the file itself
+                # instead of decoding it here and re-encoding it to a temporary PNG
+                import pytesseract
+
+                text = pytesseract.image_to_string(file_path, lang=OCR_LANGUAGE, config=OCR_CONFIG)
+            elif frame_count == 1:
+                text = _ocr_image(image)
+            else:
+                # Multi-page TIFFs: OCR the pages in parallel, each Tesseract call runs in its own process
+                frames = []
+                for index in range(frame_count):
+                    image.seek(index)
+                    frames.append(image.copy())
+                text = "\n".join(_ocr_executor.map(_ocr_image, frames))
     except Exception as e:
         logger.error(f"Error extracting text from image: {e}")
         text = f"Error extracting text: {str(e)}"
     return text
 
-def extract_text(file_path):
-    """Extract text from a file based on its extension"""
-    _, extension = os.path.splitext(file_path.lower())
-    
-    if extension in ['.pdf']:
-        return extract_text_from_pdf(file_path)
-    elif extension in ['.docx', '.doc']:
-        return extract_text_from_docx(file_path)
-    elif extension in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif']:
-        return extract_text_from_image(file_path)
-    else:
-        # For text files or unsupported formats, try to read as text
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        except Exception as e:
-            logger.error(f"Error reading file as text: {e}")
-            return f"Unsupported file format or error reading file: {str(e)}"
-
-def save_results_to_json(file_path, data):
-    """Save analysis results to JSON file"""
+def extract_text_from_plain_file(file_path):
+    """Read text files or unsupported formats as UTF-8 text"""
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        logger.info(f"Results saved to {file_path}")
-        return True
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return file.read()
     except Exception as e:
-        logger.error(f"Error saving results to JSON: {e}")
-        return False 
\ No newline at end of file
+        logger.error(f"Error reading file as text: {e}")
+        return f"Unsupported file format or error reading file: {str(e)}"
+
+# Text extractor for each supported file extension
+EXTRACTORS = {
+    '.pdf': extract_text_from_pdf,
+    '.docx': extract_text_from_docx,
+    '.doc': extract_text_from_docx,
+    '.jpg': extract_text_from_image,
+    '.jpeg': extract_text_from_image,
+    '.png': extract_text_from_image,
+    '.bmp': extract_text_from_image,
+    '.tiff': extract_text_from_image,
+    '.tif': extract_text_from_image,
+}
+
+def extract_text(file_path):
+    """Extract text from a file based on its extension"""
+    extension = os.path.splitext(file_path)[1].lower()
+    return EXTRACTORS.get(extension, extract_text_from_plain_file)(file_path)
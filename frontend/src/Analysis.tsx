@@ -25,29 +25,17 @@ interface AnalysisEssenstials {
     mietbeginn: string;
 }
 
-const mockData: AnalysisResponse = {
-    id: "mock-id",
-    results: [
-        {
-            text: "Der Mieter darf die Mieträume nur zu Wohnzwecken nutzen.",
-            category: ["unusual"],
-            description: "Einschränkung der Nutzung ungewöhnlich restriktiv.",
-            id: "1",
-        },
-        {
-            text: "Der Vertrag verlängert sich automatisch um weitere 12 Monate.",
-            category: ["invalid"],
-            description: "Automatische Verlängerungsklausel mit ungewöhnlich langer Dauer.",
-            id: "2"
-        },
-        {
-            text: "Keine Haustiere erlaubt.",
-            category: ["fehlend"],
-            description: "Fehlt eine Ausnahmegenehmigung für Kleintiere.",
-            id: "3"
-        },
-    ],
-    essentials: { vertragsparteien: "", mietgegenstand: "", miete: "", mietbeginn: "" }
+const POLL_INTERVAL_MS = 2000;
+// Stop polling after five minutes; the backend fails analyses that take much longer
+const MAX_POLL_ATTEMPTS = 150;
+
+type AnalysisStatus = "pending" | "done" | "error" | "timeout";
+
+const STATUS_MESSAGES: { [status in AnalysisStatus]: string } = {
+    pending: "Still analyzing your rental agreement …",
+    done: "",
+    error: "The analysis failed. Please upload the document again.",
+    timeout: "The analysis is taking too long. Please try again later.",
 };
 
 interface AnalysisProps {
@@ -62,12 +50,25 @@ const Analysis: React.FC<AnalysisProps> = ({ id, backToUpload }) => {
     const [selectedFindingId, setSelectedFindingId] = useState<string | null>(null); // Neues State für die Auswahl
     const [showChecklist, setShowChecklist] = useState(true);
     const [checklistItems, setChecklistItems] = useState<ChecklistItem[] | null>([]);
+    const [status, setStatus] = useState<AnalysisStatus>("pending");
 
 
-    const fetchAnalysis = async (analysisId: string) => {
+    const fetchAnalysis = async (analysisId: string, isCancelled: () => boolean, attempt = 1) => {
         try {
             const apiUrl = import.meta.env.VITE_API_URL;
             const response = await axios.get<AnalysisResponse>(`${apiUrl}/api/analysis/${analysisId}`);
+            if (isCancelled()) return;
+            // 202: the analysis is still running in the background
+            if (response.status === 202) {
+                if (attempt >= MAX_POLL_ATTEMPTS) {
+                    setStatus("timeout");
+                    return;
+                }
+                setTimeout(() => {
+                    if (!isCancelled()) fetchAnalysis(analysisId, isCancelled, attempt + 1);
+                }, POLL_INTERVAL_MS);
+                return;
+            }
             response.data.results.forEach((f, idx) => {
                 f.id = `finding-${idx + 1}`;
             });
@@ -80,15 +81,24 @@ const Analysis: React.FC<AnalysisProps> = ({ id, backToUpload }) => {
                 { "title": "Mietbeginn / Start of lease", completed: response.data.essentials.mietbeginn != null, "description": response.data.essentials.mietbeginn ?? "------" },
 
             ]);
+            setStatus("done");
         } catch (error) {
-            console.error("Error fetching analysis, using mock data:", error);
-            setFindings(mockData.results);
+            if (isCancelled()) return;
+            // Includes 500 for analyses that failed in the background
+            console.error("Error fetching analysis:", error);
+            setFindings([]);
+            setFullText("");
+            setStatus("error");
         }
     };
 
     useEffect(() => {
         const analysisId = id;
-        fetchAnalysis(analysisId);
+        let cancelled = false;
+        fetchAnalysis(analysisId, () => cancelled);
+        return () => {
+            cancelled = true;
+        };
     }, [id, selectedFindingId, selectedCategory]);
 
     const getCategory = (categories: Category[]): Category | null => {
@@ -160,6 +170,9 @@ const Analysis: React.FC<AnalysisProps> = ({ id, backToUpload }) => {
                 <div style={styles.container}>
                     <div style={styles.documentContainer}>
                         <div style={styles.subheader}>Your Rental Agreement</div>
+                        {status !== "done" && (
+                            <div style={styles.status}>{STATUS_MESSAGES[status]}</div>
+                        )}
                         <div
                             style={styles.document}
                             dangerouslySetInnerHTML={{ __html: fullText }}
@@ -263,6 +276,11 @@ const styles: { [key: string]: React.CSSProperties } = {
         height: "70vh",
         overflowY: "auto"
     },
+    status: {
+        padding: "40px",
+        color: "#ffffff",
+        textAlign: "center",
+    },
     document: {
         padding: "40px",
         color: "#ffffff",
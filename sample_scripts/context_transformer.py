@@ -1,43 +1,72 @@
+import os
+# OpenMP/MKL-Threads vor dem Import von torch festlegen
+os.environ.setdefault("OMP_NUM_THREADS", str(os.cpu_count()))
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from sentence_transformers import SentenceTransformer
 
+# Alle Kerne für die CPU-Inferenz nutzen
+torch.set_num_threads(os.cpu_count())
+torch.set_num_interop_threads(2)
+
 # 1. Device automatisch wählen
 device = torch.device("mps" if torch.backends.mps.is_available() else "cpu")
-print(f"Using device: {device}")
+# Halbe Genauigkeit auf dem Beschleuniger, FP32 auf der CPU (dort ist FP16/BF16 meist nicht schneller)
+dtype = torch.float16 if device.type != "cpu" else torch.float32
+print(f"Using device: {device} ({dtype})")
+# Nur Inferenz: kein Autograd
+torch.set_grad_enabled(False)
 
-# 2. SentenceTransformer Modell laden (bleibt intern meist auf CPU, ist ok)
-sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
+# 2. SentenceTransformer Modell direkt auf dem Device laden
+# Fused Attention über F.scaled_dot_product_attention
+sentence_model = SentenceTransformer('all-MiniLM-L6-v2', device=str(device), model_kwargs={"attn_implementation": "sdpa"})
+if dtype == torch.float16:
+    sentence_model.half()
 
 # 3. Combiner-Netzwerk definieren
 class Combiner(nn.Module):
     def __init__(self, embedding_dim):
         super().__init__()
         self.fc1 = nn.Linear(embedding_dim * 2, embedding_dim)
-        self.relu = nn.ReLU()
         self.fc2 = nn.Linear(embedding_dim, embedding_dim)
 
     def forward(self, sentence_embedding, context_embedding):
         combined = torch.cat([sentence_embedding, context_embedding], dim=-1)
-        x = self.fc1(combined)
-        x = self.relu(x)
-        x = self.fc2(x)
-        return x
+        return self.fc2(F.relu(self.fc1(combined)))
 
 # 4. Combiner initialisieren und auf Device verschieben
-combiner = Combiner(embedding_dim=sentence_model.get_sentence_embedding_dimension()).to(device)
+combiner = Combiner(embedding_dim=sentence_model.get_sentence_embedding_dimension()).to(device=device, dtype=dtype)
+# Optional (COMPILE_COMBINER=1): cat + linear + relu + linear zu möglichst wenigen Kernels
+# fusionieren, mit torch.compile (Inductor) auf der CPU und TorchScript auf MPS. Lohnt sich nur
+# bei vielen Aufrufen; das Kompilieren kostet Sekunden und Inductor braucht einen C++-Compiler
+compiled_combiner = None
+if os.getenv("COMPILE_COMBINER") == "1":
+    if device.type == "cpu" and hasattr(torch, "compile"):
+        compiled_combiner = torch.compile(combiner)
+    else:
+        compiled_combiner = torch.jit.script(combiner)
 
 # 5. Beispieltext
 sentence = "Die Katze schläft auf dem Sofa."
 context = "Es war ein sonniger Nachmittag. Die Katze schläft auf dem Sofa. Draußen spielten Kinder."
 
-# 6. Embeddings erstellen (SentenceTransformer produziert erstmal CPU-Tensoren)
-sentence_embedding = sentence_model.encode(sentence, convert_to_tensor=True).to(device)
-context_embedding = sentence_model.encode(context, convert_to_tensor=True).to(device)
+# 6. Embeddings für Satz und Kontext in einem Forward-Pass erstellen (liegen bereits auf dem Device)
+with torch.inference_mode():
+    embeddings = sentence_model.encode([sentence, context], convert_to_tensor=True, batch_size=2).to(dtype)
+sentence_embedding, context_embedding = embeddings[0], embeddings[1]
 
 # 7. Finales Kontext-Embedding berechnen
-final_embedding = combiner(sentence_embedding, context_embedding)
+with torch.inference_mode():
+    final_embedding = None
+    if compiled_combiner is not None:
+        # torch.compile schlägt erst beim ersten Aufruf fehl, dann im Eager-Modus weiterrechnen
+        try:
+            final_embedding = compiled_combiner(sentence_embedding, context_embedding)
+        except Exception as e:
+            print(f"Kompilierung fehlgeschlagen, nutze Eager-Modus: {e}")
+    if final_embedding is None:
+        final_embedding = combiner(sentence_embedding, context_embedding)
 
 # 8. Ausgabe
 cosine_sim = F.cosine_similarity(final_embedding, sentence_embedding, dim=0)
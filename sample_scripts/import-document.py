@@ -1,35 +1,207 @@
+import os
+# OpenMP/MKL-Threads vor dem Import von torch festlegen
+os.environ.setdefault("OMP_NUM_THREADS", str(os.cpu_count()))
 import chromadb
+import torch
 from sentence_transformers import SentenceTransformer
-import os
+from transformers import AutoTokenizer
 import uuid
-from PyPDF2 import PdfReader
+import hashlib
+import queue
+from collections import OrderedDict
+import threading
+import numpy as np
+# PDFium (C++) extrahiert Text deutlich schneller als das reine Python-PyPDF2
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+    from PyPDF2 import PdfReader
+
+# Alle Kerne für die CPU-Inferenz nutzen
+torch.set_num_threads(os.cpu_count())
+torch.set_num_interop_threads(2)
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Mit USE_ONNX=1 läuft der Bulk-Import über ein int8-quantisiertes ONNX-Modell
+USE_ONNX = os.getenv("USE_ONNX") == "1"
+ONNX_DIR = "minilm-onnx"
+ONNX_INT8_DIR = "minilm-int8"
+
+def export_int8_model():
+    """Exportiert das Modell einmalig nach ONNX und quantisiert es dynamisch auf int8"""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    ORTModelForFeatureExtraction.from_pretrained(MODEL_NAME, export=True).save_pretrained(ONNX_DIR)
+    ORTQuantizer.from_pretrained(ONNX_DIR).quantize(
+        save_dir=ONNX_INT8_DIR,
+        quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False)
+    )
+    AutoTokenizer.from_pretrained(MODEL_NAME).save_pretrained(ONNX_INT8_DIR)
+
+class OnnxMiniLM:
+    """Ersetzt SentenceTransformer.encode() durch eine ONNX-Runtime-Session"""
+
+    def __init__(self, model_dir, max_seq_length=256):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        model_file = next(name for name in os.listdir(model_dir) if name.endswith(".onnx"))
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file), providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.max_seq_length = max_seq_length
+
+    def encode(self, sentences, batch_size=64, **kwargs):
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            encoded = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            inputs = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            token_embeddings = self.session.run(None, inputs)[0]
+            # Mean Pooling und L2-Normierung wie im Original-Modell
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        return np.concatenate(batches) if batches else np.empty((0, 384), dtype=np.float32)
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
-client = chromadb.Client(chromadb.config.Settings(
-    chroma_db_impl="duckdb+parquet",
-    persist_directory="../chroma_data"
-))
+if USE_ONNX:
+    if not os.path.isdir(ONNX_INT8_DIR):
+        export_int8_model()
+    model = OnnxMiniLM(ONNX_INT8_DIR)
+else:
+    # Fused Attention über F.scaled_dot_product_attention
+    model = SentenceTransformer(MODEL_NAME, model_kwargs={"attn_implementation": "sdpa"})
+    # FP16 halbiert auf der GPU Gewichte und Aktivierungen
+    if torch.cuda.is_available():
+        model.half()
+# PersistentClient (Chroma >= 0.4) schreibt jedes add() direkt, persist() entfällt
+client = chromadb.PersistentClient(path="../chroma_data")
 collection = client.get_or_create_collection("documents")
 
-def chunk_text(text, max_length=500):
-    words = text.split()
-    for i in range(0, len(words), max_length):
-        yield " ".join(words[i:i + max_length])
+# MiniLM schneidet nach 256 Tokens ab; zwei Plätze bleiben für [CLS] und [SEP]
+MAX_CHUNK_TOKENS = 254
+ENCODE_BATCH_SIZE = 32
+tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+
+def chunk_text(text, max_tokens=MAX_CHUNK_TOKENS):
+    # Chunks nach Tokens statt Wörtern schneiden, damit jeder das Kontextfenster füllt,
+    # ohne abgeschnitten zu werden; die Offsets erlauben Slices direkt aus dem Text
+    encoding = tokenizer(text, return_offsets_mapping=True, add_special_tokens=False, verbose=False)
+    offsets = encoding["offset_mapping"]
+    word_ids = encoding.word_ids()
+    start = 0
+    while start < len(offsets):
+        end = min(start + max_tokens, len(offsets))
+        # WordPiece-Tokens sind Wortteile: das Ende auf eine Wortgrenze zurücksetzen,
+        # außer ein einzelnes Wort ist länger als ein ganzer Chunk
+        cut = end
+        while cut < len(offsets) and cut > start and word_ids[cut] == word_ids[cut - 1]:
+            cut -= 1
+        if cut > start:
+            end = cut
+        yield text[offsets[start][0]:offsets[end - 1][1]]
+        start = end
+
+def read_pdf_pages(pdf_path):
+    if pdfium is None:
+        for page in PdfReader(pdf_path).pages:
+            yield page.extract_text() or ""
+        return
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            page_text = textpage.get_text_range()
+            # Native Handles sofort freigeben statt erst beim Schließen des Dokuments
+            textpage.close()
+            page.close()
+            yield page_text
+    finally:
+        pdf.close()
+
+def produce_chunk_batches(pdf_path, batches):
+    # Läuft im Hintergrund-Thread: Seiten lesen und in Batches von Chunks aufteilen
+    try:
+        batch = []
+        for page_text in read_pdf_pages(pdf_path):
+            batch.extend(chunk for chunk in chunk_text(page_text) if chunk.strip())
+            if len(batch) >= ENCODE_BATCH_SIZE:
+                batches.put(batch)
+                batch = []
+        if batch:
+            batches.put(batch)
+        batches.put(None)
+    except Exception as e:
+        batches.put(e)
+
+# Wiederkehrende Klauseln und Überschriften nur einmal einbetten
+EMBEDDING_CACHE_SIZE = 10000
+_embedding_cache = OrderedDict()
+
+def encode_chunks(chunks):
+    missing = list(dict.fromkeys(chunk for chunk in chunks if chunk not in _embedding_cache))
+    if missing:
+        with torch.inference_mode():
+            new_embeddings = model.encode(
+                missing, batch_size=ENCODE_BATCH_SIZE, convert_to_numpy=True, show_progress_bar=False
+            ).tolist()
+        _embedding_cache.update(zip(missing, new_embeddings))
+    embeddings = []
+    for chunk in chunks:
+        _embedding_cache.move_to_end(chunk)
+        embeddings.append(_embedding_cache[chunk])
+    while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+        _embedding_cache.popitem(last=False)
+    return embeddings
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
 
 def import_pdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    text = "\n".join(page.extract_text() or "" for page in reader.pages)
-    for chunk in chunk_text(text):
-        embedding = model.encode([chunk])[0].tolist()
-        print(chunk)
-        collection.add(
-            documents=[chunk],
-            embeddings=[embedding],
-            ids=[str(uuid.uuid4())],
-            metadatas=[{"source": pdf_path}]
-        )
-    exit()
-    client.persist()
+    # Bereits importierte Dateien (gleicher Inhalt) weder parsen noch neu einbetten
+    content_hash = file_hash(pdf_path)
+    if collection.get(where={"content_hash": content_hash}, limit=1, include=[])["ids"]:
+        print(f"⏭️ {pdf_path} ist bereits importiert")
+        return
+    # PDF-Parsing im Producer-Thread überlappt mit dem Einbetten im Haupt-Thread
+    batches = queue.Queue(maxsize=4)
+    producer = threading.Thread(target=produce_chunk_batches, args=(pdf_path, batches), daemon=True)
+    producer.start()
+    chunks = []
+    embeddings = []
+    while (batch := batches.get()) is not None:
+        if isinstance(batch, Exception):
+            raise batch
+        for chunk in batch:
+            print(chunk)
+        embeddings.extend(encode_chunks(batch))
+        chunks.extend(batch)
+    producer.join()
+    if not chunks:
+        print(f"⚠️ Kein Text in {pdf_path} gefunden")
+        return
+    # Alle Chunks mit einem einzigen add() speichern
+    collection.add(
+        documents=chunks,
+        embeddings=embeddings,
+        ids=[str(uuid.uuid4()) for _ in chunks],
+        metadatas=[{"source": pdf_path, "content_hash": content_hash}] * len(chunks)
+    )
     print(f"✅ Import abgeschlossen für {pdf_path}")
 
 import_pdf("/documents/Bewilligung.pdf")
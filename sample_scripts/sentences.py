@@ -1,12 +1,24 @@
+import os
+# OpenMP/MKL-Threads vor dem Import von torch festlegen
+os.environ.setdefault("OMP_NUM_THREADS", str(os.cpu_count()))
 import chromadb
+import torch
 from sentence_transformers import SentenceTransformer
 import uuid
 
+# Alle Kerne für die CPU-Inferenz nutzen
+torch.set_num_threads(os.cpu_count())
+torch.set_num_interop_threads(2)
+
 # 1. Setup: ChromaDB & Embedding-Modell
 client = chromadb.Client()
 collection = client.get_or_create_collection("test_saetze")
 
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+# Fused Attention über F.scaled_dot_product_attention
+model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2", model_kwargs={"attn_implementation": "sdpa"})
+# FP16 halbiert auf der GPU Gewichte und Aktivierungen
+if torch.cuda.is_available():
+    model.half()
 
 # 2. Beispiel-Sätze definieren
 sätze = [
@@ -18,21 +30,22 @@ sätze = [
 ]
 
 # 3. Embeddings erzeugen & einfügen
-embeddings = model.encode(sätze)
-
-for satz, emb in zip(sätze, embeddings):
-    collection.add(
-        documents=[satz],
-        embeddings=[emb.tolist()],
-        ids=[str(uuid.uuid4())],
-        metadatas=[{"info": "Beispiel"}]
-    )
+with torch.inference_mode():
+    embeddings = model.encode(sätze)
+
+collection.add(
+    documents=sätze,
+    embeddings=embeddings.tolist(),
+    ids=[str(uuid.uuid4()) for _ in sätze],
+    metadatas=[{"info": "Beispiel"} for _ in sätze]
+)
 
 # 4. Suchanfrage definieren
 query = "Wie lange ist die Kündigungsfrist?"
 
 # 5. Embedding für die Anfrage erzeugen
-query_embedding = model.encode([query])[0].tolist()
+with torch.inference_mode():
+    query_embedding = model.encode([query])[0].tolist()
 
 # 6. Suche durchführen
 results = collection.query(
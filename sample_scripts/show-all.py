@@ -1,31 +1,32 @@
 import chromadb
-from sentence_transformers import SentenceTransformer
-import os
-import uuid
-from PyPDF2 import PdfReader
 
-# Stelle eine Verbindung zur Chroma-Datenbank her
-client = chromadb.Client(chromadb.config.Settings(
-    chroma_db_impl="duckdb+parquet",
-    persist_directory="../chroma_data"
-))
+# Dokumente seitenweise laden, damit große Sammlungen nicht auf einmal im Speicher liegen
+PAGE_SIZE = 1000
+
+# Stelle eine Verbindung zur Chroma-Datenbank her (dieselbe wie in import-document.py)
+client = chromadb.PersistentClient(path="../chroma_data")
 
 # Hole oder erstelle die Sammlung 'documents'
 collection = client.get_or_create_collection("documents")
 
 # Teste, ob Dokumente vorhanden sind
 def get_all_documents():
-    # Abfrage der Sammlung, die alle Dokumente enthält
-    results = collection.get()
-    
-    # Überprüfe, ob Ergebnisse vorhanden sind
-    if not results['documents']:
-        print("Keine Dokumente gefunden.")
-        return
+    count = 0
+    while True:
+        # Nur die Texte abfragen; Embeddings und Metadaten werden nicht übertragen
+        results = collection.get(include=["documents"], limit=PAGE_SIZE, offset=count)
+        documents = results['documents']
+        if not documents:
+            break
 
-    # Ausgabe der Dokumente
-    for i, doc in enumerate(results['documents']):
-        print(f"Dokument {i + 1}:\n{doc}\n")
+        # Ausgabe der Dokumente
+        for doc in documents:
+            count += 1
+            print(f"Dokument {count}:\n{doc}\n")
+
+    # Überprüfe, ob Ergebnisse vorhanden waren
+    if count == 0:
+        print("Keine Dokumente gefunden.")
 
 if __name__ == "__main__":
     get_all_documents()